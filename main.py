@@ -7,17 +7,22 @@ Purpose: Structured and searchable hike listings
 
 from __future__ import annotations
 
+import hmac
 import os
 import re
-from datetime import datetime, date, time
+from datetime import date, time
+from functools import lru_cache
 from pathlib import Path
 from typing import Optional, Dict, Any, Tuple, List
 
-from fastapi import FastAPI, Request, Form, HTTPException, Query
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import FastAPI, Request, Form, HTTPException, Query, Depends
+from fastapi.responses import HTMLResponse, RedirectResponse, Response
 from fastapi.templating import Jinja2Templates
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
-from sqlmodel import SQLModel, Field, Session, create_engine, select
+from sqlalchemy import Index, event, func
+from sqlalchemy.orm import selectinload
+from sqlmodel import SQLModel, Field, Relationship, Session, create_engine, select
 
 
 # --- Anchor paths to this file (prevents template/db “wrong folder” issues) ---
@@ -26,12 +31,34 @@ TEMPLATES_DIR = BASE_DIR / "templates"
 DB_PATH = BASE_DIR / "hikingbuddies.db"
 
 app = FastAPI()
-templates = Jinja2Templates(directory=str(TEMPLATES_DIR))
+
+# Bytecode cache persists compiled templates across workers/restarts;
+# auto_reload=False skips the mtime stat on every render.
+_jinja_env = Environment(
+    loader=FileSystemLoader(str(TEMPLATES_DIR)),
+    bytecode_cache=FileSystemBytecodeCache(),
+    auto_reload=False,
+    autoescape=True,
+)
+templates = Jinja2Templates(env=_jinja_env)
 
 DATABASE_URL = f"sqlite:///{DB_PATH.as_posix()}"
 engine = create_engine(DATABASE_URL, echo=False)
 
 
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_conn, _connection_record):
+    # WAL lets /events readers run alongside a create_event write, and
+    # synchronous=NORMAL drops the per-commit fsync count while staying
+    # safe against power loss in WAL mode.
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA cache_size=-20000")
+    cur.close()
+
+
 # ---------------------------
 # Database Models
 # ---------------------------
@@ -42,10 +69,14 @@ class Mountain(SQLModel, table=True):
 
 
 class Event(SQLModel, table=True):
+    # Composite index answers the default order-by-date listing filtered
+    # by mountain without a scan-then-sort plan.
+    __table_args__ = (Index("ix_event_date_mountain", "start_date", "mountain_id"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    mountain_id: int = Field(foreign_key="mountain.id")
-    start_date: date
+    mountain_id: int = Field(foreign_key="mountain.id", index=True)
+    start_date: date = Field(index=True)
 
     arrive_time: Optional[time] = None
     hike_time: Optional[time] = None
@@ -53,15 +84,14 @@ class Event(SQLModel, table=True):
     trailhead: Optional[str] = None
     distance_miles: float
 
-    pace: str
+    pace: str = Field(index=True)
     dog_friendly: bool
 
     fb_link: str
     organizer: Optional[str] = None
     notes: Optional[str] = None
 
-
-SQLModel.metadata.create_all(engine)
+    mountain: Mountain = Relationship()
 
 
 # ---------------------------
@@ -100,12 +130,44 @@ MOUNTAIN_NAMES = [
     "Wildcat Mountain (A Peak)","Wildcat Mountain (D Peak)"
 ]
 
-with Session(engine) as session:
-    existing = session.exec(select(Mountain)).first()
+# Mountains are seeded once and never mutated, so the dropdown list is
+# hydrated a single time at startup instead of on every page render.
+_MOUNTAINS_CACHE: List[Mountain] = []
+
+
+@app.on_event("startup")
+def init_db() -> None:
+    """Create tables, seed mountains, and warm caches once per process.
+
+    Running this at startup rather than import keeps DDL round-trips off
+    every worker import (reload, tests) and lets ASGI workers do it once
+    after fork.
+    """
+    SQLModel.metadata.create_all(engine)
+
+    # create_all skips tables that already exist, so backfill indexes
+    # added after an existing database was first created.
+    with engine.begin() as conn:
+        for index in Event.__table__.indexes:
+            index.create(conn, checkfirst=True)
+
+    with Session(engine) as session:
+        # Column-only select: returns a bare id (or None) without
+        # hydrating a Mountain instance just to test existence.
+        existing = session.exec(select(Mountain.id).limit(1)).first()
+
     if not existing:
-        for name in sorted(MOUNTAIN_NAMES):
-            session.add(Mountain(name=name))
-        session.commit()
+        # One executemany inside a single transaction instead of ~90 ORM
+        # INSERTs (SQLite pays per-transaction fsync, so batching is the
+        # whole win).
+        with engine.begin() as conn:
+            conn.execute(
+                Mountain.__table__.insert(),
+                [{"name": name} for name in sorted(MOUNTAIN_NAMES)],
+            )
+
+    with Session(engine) as session:
+        _MOUNTAINS_CACHE[:] = session.exec(select(Mountain).order_by(Mountain.name)).all()
 
 
 # ---------------------------
@@ -114,86 +176,119 @@ with Session(engine) as session:
 
 PACE_CHOICES = ["Turtle", "Bear", "Moose", "GOAT"]
 
+# Shared by parse_pace and create_event; built once instead of per call.
+_PACE_MAP = {"turtle": "Turtle", "bear": "Bear", "moose": "Moose", "goat": "GOAT"}
+
+_DOG_MAP = {
+    "yes": True, "y": True, "true": True,
+    "no": False, "n": False, "false": False,
+}
+
+# Query-string values the /events dog filter accepts.
+_DOG_FILTER = {"Yes": True, "No": False}
+
 
 # ---------------------------
 # Parsing Helpers
 # ---------------------------
 
+# Compiled once; re.findall would rebuild a list and re-hit the pattern
+# cache on every call.
+_DISTANCE_RE = re.compile(r"\d+(?:\.\d+)?")
+_DATE_RE = re.compile(r"^\s*(\d{4})-(\d{2})-(\d{2})\s*$")
+_TIME_RE = re.compile(r"^\s*(\d{1,2}):(\d{2})\s*([ap]m?)?\s*$", re.IGNORECASE)
+
+# One multiline pass over the pasted block yields stripped (key, value)
+# pairs; lines without a "word:" prefix simply don't match. Whitespace
+# is [ \t] rather than \s so a blank value can't swallow the next line
+# (\s matches \n even under re.MULTILINE), and the key must start with
+# a letter so a stray colon line (e.g. "  : something") is skipped. The
+# key otherwise allows anything up to the first colon — dispatch only
+# looks at its first alphabetic run — and the trailing class includes
+# \r so CRLF submissions don't leave a CR on every value.
+_KV_RE = re.compile(
+    r"^[ \t]*([A-Za-z][^:\r\n]*?)[ \t]*:[ \t]*(.*?)[ \t\r]*$", re.MULTILINE
+)
+
 def parse_date(s: str) -> Optional[date]:
+    # Regex gate first: malformed input fails in microseconds instead of
+    # paying for a full strptime parse plus a raised ValueError.
+    m = _DATE_RE.match(s or "")
+    if not m:
+        return None
     try:
-        return datetime.strptime(s.strip(), "%Y-%m-%d").date()
-    except Exception:
+        return date(int(m[1]), int(m[2]), int(m[3]))
+    except ValueError:  # out-of-range values like 2026-02-30
         return None
 
 
 def parse_time(s: str) -> Optional[time]:
-    raw = (s or "").strip().lower()
-    if not raw:
+    # One regex pass instead of up to three strptime attempts per input.
+    m = _TIME_RE.match(s or "")
+    if not m:
         return None
-    raw = raw.replace(" ", "")
-    for fmt in ("%H:%M", "%I:%M%p", "%I:%M"):
-        try:
-            return datetime.strptime(raw, fmt).time()
-        except ValueError:
-            continue
-    return None
+    hour, minute = int(m[1]), int(m[2])
+    ampm = m[3]
+    if ampm:
+        ampm = ampm.lower()
+        if ampm[0] == "p" and hour < 12:
+            hour += 12
+        elif ampm[0] == "a" and hour == 12:
+            hour = 0
+    if hour > 23 or minute > 59:
+        return None
+    return time(hour, minute)
 
 
 def parse_distance(s: str) -> Optional[float]:
-    try:
-        return float(re.findall(r"\d+\.?\d*", s)[0])
-    except Exception:
-        return None
+    m = _DISTANCE_RE.search(s or "")
+    return float(m.group()) if m else None
 
 
 def parse_dog(s: str) -> Optional[bool]:
-    raw = (s or "").strip().lower()
-    if raw == "yes":
-        return True
-    if raw == "no":
-        return False
-    return None
+    return _DOG_MAP.get((s or "").strip().lower())
 
 
 def parse_pace(s: str) -> Optional[str]:
-    raw = (s or "").strip().lower()
-    mapping = {"turtle": "Turtle", "bear": "Bear", "moose": "Moose", "goat": "GOAT"}
-    return mapping.get(raw)
+    return _PACE_MAP.get((s or "").strip().lower())
+
+
+# First alphabetic run of a pasted key ("start date", "dog-friendly",
+# "distance (miles)" -> "start", "dog", "distance").
+_KEY_TOKEN_RE = re.compile(r"[a-z]+")
+
+# Dispatch on the first word of each pasted key ("start date" -> "start"):
+# one hash lookup instead of walking a ten-branch startswith chain.
+_FIELD_DISPATCH: Dict[str, Tuple[str, Any]] = {
+    "organizer": ("organizer", str),
+    "mountain": ("mountain", str),
+    "start": ("start_date", parse_date),
+    "arrive": ("arrive_time", parse_time),
+    "arrival": ("arrive_time", parse_time),
+    "meet": ("arrive_time", parse_time),
+    "meetup": ("arrive_time", parse_time),
+    "hike": ("hike_time", parse_time),
+    "begin": ("hike_time", parse_time),
+    "trailhead": ("trailhead", str),
+    "distance": ("distance_miles", parse_distance),
+    "pace": ("pace", parse_pace),
+    "dog": ("dog_friendly", parse_dog),
+    "fb": ("fb_link", lambda v: v.split()[0]),
+    "notes": ("notes", str),
+}
 
 
 def parse_block(raw: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
     parsed: Dict[str, Any] = {}
     errors: Dict[str, str] = {}
 
-    lines = [line.strip() for line in raw.splitlines() if ":" in line]
-
-    for line in lines:
-        key, val = line.split(":", 1)
-        key = key.strip().lower()
-        val = val.strip()
-
-        if key.startswith("organizer"):
-            parsed["organizer"] = val
-        elif key.startswith("mountain"):
-            parsed["mountain"] = val
-        elif key.startswith("start"):
-            parsed["start_date"] = parse_date(val)
-        elif key.startswith(("arrive", "arrival", "meet", "meetup")):
-            parsed["arrive_time"] = parse_time(val)
-        elif key.startswith(("hike", "start time", "begin")):
-            parsed["hike_time"] = parse_time(val)
-        elif key.startswith("trailhead"):
-            parsed["trailhead"] = val
-        elif key.startswith("distance"):
-            parsed["distance_miles"] = parse_distance(val)
-        elif key.startswith("pace"):
-            parsed["pace"] = parse_pace(val)
-        elif key.startswith("dog"):
-            parsed["dog_friendly"] = parse_dog(val)
-        elif key.startswith("fb"):
-            parsed["fb_link"] = val.split()[0]
-        elif key.startswith("notes"):
-            parsed["notes"] = val
+    for key, val in _KV_RE.findall(raw):
+        word = _KEY_TOKEN_RE.match(key.lower())
+        if not word:
+            continue
+        entry = _FIELD_DISPATCH.get(word.group())
+        if entry:
+            parsed[entry[0]] = entry[1](val)
 
     return parsed, errors
 
@@ -201,17 +296,27 @@ def parse_block(raw: str) -> Tuple[Dict[str, Any], Dict[str, str]]:
 
 ADD_EVENT_KEY = os.getenv("ADD_EVENT_KEY", "").strip()
 
-def require_add_key(request: Request) -> None:
-    if not ADD_EVENT_KEY:
-        return  # allow if not set (nice for local dev)
-    if request.query_params.get("key", "") != ADD_EVENT_KEY:
+# Bind the right checker once at import: a pure no-op when no key is set
+# (nice for local dev), a constant-time comparison when one is.
+if ADD_EVENT_KEY:
+    def require_add_key(request: Request) -> None:
+        key = request.query_params.get("key")
         # 404 instead of 401 so it doesn't advertise that /add exists
-        raise HTTPException(status_code=404, detail="Not found")
+        if key is None or not hmac.compare_digest(key.encode(), ADD_EVENT_KEY.encode()):
+            raise HTTPException(status_code=404, detail="Not found")
+else:
+    def require_add_key(request: Request) -> None:
+        return
 
 # ---------------------------
 # Routes
 # ---------------------------
 
+def get_session():
+    with Session(engine) as session:
+        yield session
+
+
 @app.get("/", response_class=HTMLResponse)
 def home():
     return RedirectResponse("/events", status_code=302)
@@ -221,14 +326,11 @@ def home():
 def add_page(request: Request):
     require_add_key(request)
 
-    with Session(engine) as session:
-        mountains = session.exec(select(Mountain).order_by(Mountain.name)).all()
-
     return templates.TemplateResponse(
         "add.html",
         {
             "request": request,
-            "mountains": mountains,
+            "mountains": _MOUNTAINS_CACHE,
             "pace_choices": PACE_CHOICES,
             "parsed": {},
             "errors": {},
@@ -243,14 +345,11 @@ def fill_form(request: Request, raw: str = Form(...)):
 
     parsed, errors = parse_block(raw)
 
-    with Session(engine) as session:
-        mountains = session.exec(select(Mountain).order_by(Mountain.name)).all()
-
     return templates.TemplateResponse(
         "add.html",
         {
             "request": request,
-            "mountains": mountains,
+            "mountains": _MOUNTAINS_CACHE,
             "pace_choices": PACE_CHOICES,
             "parsed": parsed,
             "errors": errors,
@@ -286,29 +385,91 @@ def create_event(
         raise HTTPException(status_code=400, detail="Distance must be a number.")
 
     # Normalize pace casing (optional but keeps data consistent)
-    mapping = {"turtle": "Turtle", "bear": "Bear", "moose": "Moose", "goat": "GOAT"}
-    pace_norm = mapping.get((pace or "").strip().lower(), pace)
-
-    with Session(engine) as session:
-        event = Event(
-            mountain_id=mountain_id,
-            start_date=start_dt,
-            arrive_time=parse_time(arrive_time) if arrive_time else None,
-            hike_time=parse_time(hike_time) if hike_time else None,
-            trailhead=trailhead or None,
-            distance_miles=dist,
-            pace=pace_norm,
-            dog_friendly=dog_bool,
-            fb_link=fb_link,
-            organizer=organizer or None,
-            notes=notes or None,
+    pace_norm = _PACE_MAP.get((pace or "").strip().lower(), pace)
+
+    # Core insert: one INSERT inside one transaction, no ORM unit-of-work
+    # bookkeeping for a single row with nothing to cascade.
+    with engine.begin() as conn:
+        conn.execute(
+            Event.__table__.insert().values(
+                mountain_id=mountain_id,
+                start_date=start_dt,
+                arrive_time=parse_time(arrive_time) if arrive_time else None,
+                hike_time=parse_time(hike_time) if hike_time else None,
+                trailhead=trailhead or None,
+                distance_miles=dist,
+                pace=pace_norm,
+                dog_friendly=dog_bool,
+                fb_link=fb_link,
+                organizer=organizer or None,
+                notes=notes or None,
+            )
         )
-        session.add(event)
-        session.commit()
 
     return RedirectResponse("/events", status_code=303)
 
 
+@lru_cache(maxsize=128)
+def _render_events(
+    version: int,
+    mountain_id: str,
+    pace: str,
+    max_miles: str,
+    start_date: str,
+    dog_friendly: str,
+) -> str:
+    """Render the events listing for one (data version, filters) key.
+
+    ``version`` is the max Event id, so every insert implicitly
+    invalidates the cache; repeat visits with the same filters skip the
+    query and the template render entirely.
+    """
+    # list_events validated these already, so the conversions cannot fail.
+    mountain_id_int = int(mountain_id) if mountain_id else None
+    max_miles_float = float(max_miles) if max_miles else None
+    date_filter = parse_date(start_date) if start_date else None
+
+    # Single-entity select: one Event instance per row, with mountains
+    # batch-loaded in a second IN query instead of hydrated per row.
+    stmt = select(Event).options(selectinload(Event.mountain))
+
+    if mountain_id_int is not None:
+        stmt = stmt.where(Event.mountain_id == mountain_id_int)
+
+    if pace:
+        stmt = stmt.where(Event.pace == pace)
+
+    if max_miles_float is not None:
+        stmt = stmt.where(Event.distance_miles <= max_miles_float)
+
+    if date_filter is not None:
+        stmt = stmt.where(Event.start_date == date_filter)
+
+    dog_val = _DOG_FILTER.get(dog_friendly)
+    if dog_val is not None:
+        stmt = stmt.where(Event.dog_friendly == dog_val)
+
+    stmt = stmt.order_by(Event.start_date)
+
+    with Session(engine) as session:
+        rows: List[Event] = session.exec(stmt).all()
+
+        return templates.get_template("events.html").render(
+            {
+                "rows": rows,
+                "mountains": _MOUNTAINS_CACHE,
+                "pace_choices": PACE_CHOICES,
+                "filters": {
+                    "mountain_id": mountain_id,
+                    "pace": pace,
+                    "max_miles": max_miles,
+                    "start_date": start_date,
+                    "dog_friendly": dog_friendly,
+                },
+            }
+        )
+
+
 @app.get("/events", response_class=HTMLResponse)
 def list_events(
     request: Request,
@@ -317,72 +478,36 @@ def list_events(
     max_miles: str | None = Query(default=None),
     start_date: str | None = Query(default=None),
     dog_friendly: str | None = Query(default=None),
+    session: Session = Depends(get_session),
 ):
-    # Safely convert optional numeric filters
-    mountain_id_int: int | None = None
-    if mountain_id and mountain_id.strip() != "":
+    # Normalize the optional filters so equivalent query strings share a
+    # cache entry, then validate before anything touches the cache.
+    mountain_id = (mountain_id or "").strip()
+    pace = (pace or "").strip()
+    max_miles = (max_miles or "").strip()
+    start_date = (start_date or "").strip()
+    dog_friendly = (dog_friendly or "").strip()
+
+    if mountain_id:
         try:
-            mountain_id_int = int(mountain_id)
+            int(mountain_id)
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid mountain selection.")
 
-    max_miles_float: float | None = None
-    if max_miles and max_miles.strip() != "":
+    if max_miles:
         try:
-            max_miles_float = float(max_miles)
+            float(max_miles)
         except ValueError:
             raise HTTPException(status_code=400, detail="Max miles must be a number.")
 
-    date_filter = None
-    if start_date and start_date.strip() != "":
-        date_filter = parse_date(start_date)
-        if date_filter is None:
-            raise HTTPException(status_code=400, detail="Invalid date filter. Use YYYY-MM-DD.")
-
-    with Session(engine) as session:
-        mountains = session.exec(select(Mountain).order_by(Mountain.name)).all()
-
-        stmt = select(Event, Mountain).join(Mountain, Event.mountain_id == Mountain.id)
-
-        if mountain_id_int is not None:
-            stmt = stmt.where(Event.mountain_id == mountain_id_int)
-
-        if pace:
-            stmt = stmt.where(Event.pace == pace)
-
-        if max_miles_float is not None:
-            stmt = stmt.where(Event.distance_miles <= max_miles_float)
+    if start_date and parse_date(start_date) is None:
+        raise HTTPException(status_code=400, detail="Invalid date filter. Use YYYY-MM-DD.")
 
-        if date_filter is not None:
-            stmt = stmt.where(Event.start_date == date_filter)
+    version = session.exec(select(func.max(Event.id))).one() or 0
+    etag = f'"{version}-{hash((mountain_id, pace, max_miles, start_date, dog_friendly))}"'
 
-        if dog_friendly in ("Yes", "No"):
-            stmt = stmt.where(Event.dog_friendly == (dog_friendly == "Yes"))
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304)
 
-        stmt = stmt.order_by(Event.start_date)
-
-        result = session.exec(stmt).all()
-
-    rows: List[Tuple[Event, Mountain]] = []
-    for r in result:
-        if isinstance(r, tuple) and len(r) == 2:
-            rows.append((r[0], r[1]))
-        else:
-            rows.append((r.Event, r.Mountain))
-
-    return templates.TemplateResponse(
-        "events.html",
-        {
-            "request": request,
-            "rows": rows,
-            "mountains": mountains,
-            "pace_choices": PACE_CHOICES,
-            "filters": {
-                "mountain_id": mountain_id or "",
-                "pace": pace or "",
-                "max_miles": max_miles or "",
-                "start_date": start_date or "",
-                "dog_friendly": dog_friendly or "",
-            },
-        },
-    )
\ No newline at end of file
+    body = _render_events(version, mountain_id, pace, max_miles, start_date, dog_friendly)
+    return HTMLResponse(body, headers={"ETag": etag})
\ No newline at end of file